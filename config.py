@@ -19,6 +19,36 @@ class Settings(BaseSettings):
     # 工作流执行超时时间（秒）
     workflow_timeout_seconds: int = 120
     
+    # 两次提交工作流之间的最短间隔（秒）
+    submit_cooldown_seconds: int = 30
+    
+    # 服务器提示已自动执行后，等待多少秒再重新检查
+    auto_exec_wait_seconds: int = 30
+    
+    # 事件记录文件路径（JSON Lines，供simulator.py回放），为空则不记录
+    record_path: str = ""
+    
+    # 每个服务器保留的检查周期trace数量
+    trace_buffer_size: int = 50
+    
+    # trace导出文件路径（OTLP JSON Lines），为空则不导出
+    trace_export_path: str = ""
+    
+    # 预测性预热：按时段学习缓存驱逐规律，在预计驱逐窗口内加密探测
+    prewarm_enabled: bool = True
+    # 统计驱逐的时段长度（分钟）
+    prewarm_slot_minutes: int = 15
+    # 同一时段至少在多少天内发生过驱逐才视为规律
+    prewarm_min_occurrences: int = 2
+    # 在预计驱逐时段开始前多少秒开始加密探测
+    prewarm_lead_seconds: int = 120
+    # 预计驱逐窗口内的探测间隔（秒）
+    prewarm_probe_interval_seconds: int = 10
+    # 保留多少天的驱逐记录
+    prewarm_history_days: int = 14
+    # 驱逐记录的保存文件，重启后从中恢复，为空则只保存在内存中
+    prewarm_history_path: str = "prewarm_history.json"
+    
     @property
     def servers(self) -> List[str]:
         """将服务器字符串转换为列表"""
@@ -10,6 +10,13 @@ from typing import List, Dict, Any
 import os
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from config import settings
+from tracing import Trace, TraceStore, current_trace, trace_span, start_span, end_span
+from prewarm import EvictionPredictor, parse_missing_cache_keys
+from recorder import EventRecorder
+from policy import (
+    CACHE_LOADED, WAIT_AUTO_EXEC, SUBMITTING,
+    next_check_action, submission_wait_seconds, submission_block_reason
+)
 
 # 配置日志
 logging.basicConfig(
@@ -27,6 +34,24 @@ scheduler = AsyncIOScheduler()
 # 全局变量：跟踪每个服务器的提交状态
 server_submission_status = {}  # {server_url: {"last_submission_time": timestamp, "is_submitting": bool}}
 
+# 每个服务器最近的检查周期trace
+trace_store = TraceStore(settings.trace_buffer_size, settings.trace_export_path)
+
+# 从探测历史中学习缓存驱逐规律
+eviction_predictor = EvictionPredictor(
+    slot_minutes=settings.prewarm_slot_minutes,
+    min_occurrences=settings.prewarm_min_occurrences,
+    lead_seconds=settings.prewarm_lead_seconds,
+    history_days=settings.prewarm_history_days,
+    history_path=settings.prewarm_history_path
+)
+
+# 记录探测、提交、完成事件，供回放模拟器使用
+event_recorder = EventRecorder(settings.record_path)
+
+# 每个服务器正在进行的检查数量 {server_url: count}，预热探测据此避免与其他检查叠加
+checks_in_flight = {}
+
 # 加载工作流JSON
 def load_workflow():
     try:
@@ -36,31 +61,53 @@ def load_workflow():
         logger.error(f"加载工作流失败: {e}")
         return None
 
+# 探测来源：检查周期中的探测为该周期的触发来源（regular/prewarm），其余为状态页面/接口的探测
+def probe_source() -> str:
+    trace = current_trace.get()
+    return trace.trigger if trace is not None else "status"
+
 # 检查缓存状态
 async def check_cache_status(server_url: str) -> tuple[bool, bool]:
     """
     检查服务器缓存状态
     返回: (缓存是否已加载, 服务器是否已自动执行工作流)
     """
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            url = f"{server_url}/inspire/cache/determine"
-            response = await client.get(url)
-            if response.status_code == 200:
-                response_text = response.text
-                cache_loaded = "缓存已加载" in response_text
-                auto_executing = "已经自动在后台执行缓存模型工作流" in response_text
-                
-                if auto_executing:
-                    logger.info(f"服务器已自动在后台执行缓存工作流: {server_url}")
-                
-                return cache_loaded, auto_executing
-            else:
-                logger.error(f"检查缓存状态失败: {response.status_code}")
-                return False, False
-    except Exception as e:
-        logger.error(f"检查缓存状态异常: {e}")
-        return False, False
+    with trace_span("determine") as span:
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                url = f"{server_url}/inspire/cache/determine"
+                response = await client.get(url)
+                if response.status_code == 200:
+                    response_text = response.text
+                    cache_loaded = "缓存已加载" in response_text
+                    auto_executing = "已经自动在后台执行缓存模型工作流" in response_text
+                    
+                    if auto_executing:
+                        logger.info(f"服务器已自动在后台执行缓存工作流: {server_url}")
+                    
+                    # 先结束determine阶段，下面的驱逐学习和事件记录会写文件，不计入探测耗时
+                    end_span(span, cache_loaded=cache_loaded, auto_executing=auto_executing)
+                    missing_keys = parse_missing_cache_keys(response_text)
+                    # 学习驱逐规律失败不能影响探测结果，否则已加载的服务器会被当作未加载
+                    try:
+                        eviction_predictor.observe(server_url, cache_loaded, missing_keys)
+                    except Exception as e:
+                        logger.error(f"记录缓存驱逐规律失败: {server_url}, 错误: {e}")
+                    event_recorder.record(server_url, "probe", source=probe_source(), ok=True,
+                                          cache_loaded=cache_loaded, auto_executing=auto_executing,
+                                          missing_keys=missing_keys)
+                    return cache_loaded, auto_executing
+                else:
+                    logger.error(f"检查缓存状态失败: {response.status_code}")
+                    end_span(span, ok=False, status_code=response.status_code)
+                    event_recorder.record(server_url, "probe", source=probe_source(), ok=False,
+                                          status_code=response.status_code)
+                    return False, False
+        except Exception as e:
+            logger.error(f"检查缓存状态异常: {e}")
+            end_span(span, ok=False, error=str(e))
+            event_recorder.record(server_url, "probe", source=probe_source(), ok=False, error=str(e))
+            return False, False
 
 # 获取队列状态
 async def get_queue_status(server_url: str, client: httpx.AsyncClient):
@@ -102,6 +149,11 @@ async def wait_for_workflow_completion(server_url: str, prompt_id: str, timeout:
         
     async with httpx.AsyncClient(timeout=10.0) as client:
         start_time = time.time()
+        # 排队、执行和获取历史阶段跨越多次轮询，手动开始/结束
+        queue_span = None
+        execute_span = None
+        history_span = None
+        history_attempts = 0
         
         while time.time() - start_time < timeout:
             # 检查队列状态
@@ -130,13 +182,28 @@ async def wait_for_workflow_completion(server_url: str, prompt_id: str, timeout:
                 except (KeyError, IndexError, TypeError) as e:
                     logger.warning(f"检查队列状态时出现异常: {e}")
                 
+                if is_pending and queue_span is None:
+                    queue_span = start_span("queue_wait", prompt_id=prompt_id)
+                if is_running:
+                    end_span(queue_span)
+                    if execute_span is None:
+                        execute_span = start_span("execute", prompt_id=prompt_id)
+                
                 if not is_running and not is_pending:
-                    # 任务已完成，获取执行历史
+                    end_span(queue_span)
+                    end_span(execute_span)
+                    # 任务已完成，获取执行历史（历史可能尚未写入，需要多次获取）
+                    if history_span is None:
+                        history_span = start_span("history", prompt_id=prompt_id)
+                    history_attempts += 1
                     history = await get_execution_history(server_url, prompt_id, client)
                     if history and prompt_id in history:
+                        end_span(history_span, attempts=history_attempts)
                         execution_info = history[prompt_id]
                         status = execution_info.get("status", {})
                         
+                        event_recorder.record(server_url, "completion", prompt_id=prompt_id,
+                                              success=status.get("status_str") == "success")
                         if status.get("status_str") == "success":
                             logger.info(f"工作流执行成功: {server_url}, prompt_id: {prompt_id}")
                             return True, "执行成功"
@@ -162,25 +229,29 @@ async def wait_for_workflow_completion(server_url: str, prompt_id: str, timeout:
             await asyncio.sleep(2)
         
         # 超时
+        end_span(queue_span, ok=False)
+        end_span(execute_span, ok=False)
+        end_span(history_span, ok=False, attempts=history_attempts)
+        event_recorder.record(server_url, "completion", prompt_id=prompt_id, success=False, timeout=True)
         logger.error(f"工作流执行超时: {server_url}, prompt_id: {prompt_id}")
         return False, f"执行超时 ({timeout}秒)"
 
 # 执行工作流
 async def execute_workflow(server_url: str):
     """执行缓存模型工作流并等待完成"""
-    # 检查是否正在提交
+    # 检查是否正在提交，以及上次提交是否还在冷却时间内
     if server_url in server_submission_status:
         status = server_submission_status[server_url]
-        if status.get("is_submitting", False):
+        current_time = time.time()
+        block_reason = submission_block_reason(status, current_time, settings.submit_cooldown_seconds)
+        if block_reason == SUBMITTING:
             logger.info(f"服务器正在提交工作流，跳过重复提交: {server_url}")
+            event_recorder.record(server_url, "submit_skipped", reason=block_reason)
             return False, "正在提交中，跳过重复提交"
-        
-        # 检查上次提交时间，如果在30秒内，则跳过
-        last_submission = status.get("last_submission_time", 0)
-        current_time = time.time()
-        if current_time - last_submission < 30:
-            remaining_time = 30 - (current_time - last_submission)
-            logger.info(f"距离上次提交不足30秒，等待 {remaining_time:.1f} 秒后再提交: {server_url}")
+        elif block_reason:
+            remaining_time = submission_wait_seconds(status, current_time, settings.submit_cooldown_seconds)
+            logger.info(f"距离上次提交不足{settings.submit_cooldown_seconds}秒，等待 {remaining_time:.1f} 秒后再提交: {server_url}")
+            event_recorder.record(server_url, "submit_skipped", reason=block_reason)
             return False, f"需要等待 {remaining_time:.1f} 秒后再提交"
     
     workflow_data = load_workflow()
@@ -194,16 +265,22 @@ async def execute_workflow(server_url: str):
         "last_submission_time": time.time()
     }
     
+    # 收到提交响应后的每个分支都会记录submit事件；在此之前出现异常时由下面的except记录
+    response_received = False
     try:
         async with httpx.AsyncClient(timeout=30.0) as client:
             url = f"{server_url}/prompt"
             logger.info(f"开始提交工作流到服务器: {server_url}")
-            response = await client.post(url, json={"prompt": workflow_data})
+            with trace_span("submit") as span:
+                response = await client.post(url, json={"prompt": workflow_data})
+                end_span(span, status_code=response.status_code)
+            response_received = True
             
             if response.status_code == 200:
                 # 检查响应体是否为空
                 if not response.text.strip():
                     logger.error(f"提交工作流成功但服务器返回空响应: {server_url}")
+                    event_recorder.record(server_url, "submit", ok=False, status_code=response.status_code)
                     return False, "服务器返回空响应，可能是工作流格式错误或服务器内部错误"
                 
                 try:
@@ -212,11 +289,14 @@ async def execute_workflow(server_url: str):
                     
                     if not prompt_id:
                         logger.error(f"提交工作流成功但未获取到prompt_id: {server_url}, 响应内容: {response.text}")
+                        event_recorder.record(server_url, "submit", ok=False, status_code=response.status_code)
                         return False, f"未获取到prompt_id，响应内容: {response.text}"
                 except Exception as json_error:
                     logger.error(f"解析响应JSON失败: {server_url}, 错误: {json_error}, 响应内容: {response.text}")
+                    event_recorder.record(server_url, "submit", ok=False, status_code=response.status_code)
                     return False, f"解析响应失败: {json_error}"
                 
+                event_recorder.record(server_url, "submit", ok=True, prompt_id=prompt_id)
                 logger.info(f"成功提交工作流到服务器: {server_url}, prompt_id: {prompt_id}")
                 
                 # 等待工作流执行完成
@@ -228,6 +308,7 @@ async def execute_workflow(server_url: str):
                 
                 return success, message
             else:
+                event_recorder.record(server_url, "submit", ok=False, status_code=response.status_code)
                 error_msg = f"提交工作流失败: {response.status_code}, {response.text}"
                 logger.error(error_msg)
                 return False, error_msg
@@ -235,14 +316,20 @@ async def execute_workflow(server_url: str):
     except httpx.TimeoutException:
         error_msg = f"执行工作流超时: {server_url}"
         logger.error(error_msg)
+        if not response_received:
+            event_recorder.record(server_url, "submit", ok=False, error="timeout")
         return False, error_msg
     except httpx.ConnectError:
         error_msg = f"无法连接到服务器: {server_url}"
         logger.error(error_msg)
+        if not response_received:
+            event_recorder.record(server_url, "submit", ok=False, error="connect_error")
         return False, error_msg
     except Exception as e:
         error_msg = f"执行工作流异常: {server_url}, 错误: {e}"
         logger.error(error_msg)
+        if not response_received:
+            event_recorder.record(server_url, "submit", ok=False, error=str(e))
         return False, error_msg
     finally:
         # 确保在所有情况下都清除提交状态
@@ -250,39 +337,57 @@ async def execute_workflow(server_url: str):
             server_submission_status[server_url]["is_submitting"] = False
 
 # 检查并执行工作流的主函数
-async def check_and_execute(server_url: str):
-    """检查缓存状态并在需要时执行工作流"""
+async def check_and_execute(server_url: str, trigger: str = "regular"):
+    """检查缓存状态并在需要时执行工作流，整个周期记录为一条trace"""
+    trace = Trace(server_url, trigger=trigger)
+    token = current_trace.set(trace)
+    checks_in_flight[server_url] = checks_in_flight.get(server_url, 0) + 1
+    outcome = "error"
+    try:
+        outcome = await _check_and_execute(server_url)
+    finally:
+        checks_in_flight[server_url] -= 1
+        current_trace.reset(token)
+        trace.finish(outcome)
+        trace_store.add(trace)
+
+async def _check_and_execute(server_url: str) -> str:
+    """检查缓存状态并在需要时执行工作流，返回本次周期的结果"""
     logger.info(f"检查服务器缓存状态: {server_url}")
-    cache_loaded, auto_executing = await check_cache_status(server_url)
+    wait_seconds = settings.auto_exec_wait_seconds
+    waited = False
     
-    if cache_loaded:
-        logger.info(f"服务器缓存已加载，无需执行工作流: {server_url}")
-    elif auto_executing:
-        logger.info(f"服务器提示已在后台自动执行，等待完成...: {server_url}")
-        # 等待30秒让自动执行的工作流完成
-        logger.info(f"等待30秒让后台工作流完成: {server_url}")
-        await asyncio.sleep(30)
-        
-        # 30秒后重新检查缓存状态
-        cache_loaded_after, still_auto = await check_cache_status(server_url)
+    # 下一步动作由policy.next_check_action决定（与回放模拟器共用）
+    while True:
+        cache_loaded, auto_executing = await check_cache_status(server_url)
+        action = next_check_action(cache_loaded, auto_executing, waited)
         
-        if cache_loaded_after:
-            logger.info(f"等待30秒后，服务器缓存已成功加载: {server_url}")
-            return
+        if action == CACHE_LOADED:
+            if waited:
+                logger.info(f"等待{wait_seconds}秒后，服务器缓存已成功加载: {server_url}")
+                return "auto_exec_loaded"
+            logger.info(f"服务器缓存已加载，无需执行工作流: {server_url}")
+            return "cache_loaded"
+        elif action == WAIT_AUTO_EXEC:
+            logger.info(f"服务器提示已在后台自动执行，等待完成...: {server_url}")
+            # 等待一段时间让自动执行的工作流完成，然后重新检查缓存状态
+            logger.info(f"等待{wait_seconds}秒让后台工作流完成: {server_url}")
+            with trace_span("auto_exec_wait", seconds=wait_seconds):
+                await asyncio.sleep(wait_seconds)
+            waited = True
         else:
-            logger.warning(f"等待30秒后，缓存仍未加载，尝试手动执行工作流: {server_url}")
-            success, message = await execute_workflow(server_url)
-            if success:
-                logger.info(f"成功执行缓存工作流: {server_url} - {message}")
-            else:
-                logger.error(f"执行缓存工作流失败: {server_url} - {message}")
+            break
+    
+    if waited:
+        logger.warning(f"等待{wait_seconds}秒后，缓存仍未加载，尝试手动执行工作流: {server_url}")
     else:
         logger.info(f"服务器缓存未加载，开始执行缓存工作流: {server_url}")
-        success, message = await execute_workflow(server_url)
-        if success:
-            logger.info(f"成功执行缓存工作流: {server_url} - {message}")
-        else:
-            logger.error(f"执行缓存工作流失败: {server_url} - {message}")
+    success, message = await execute_workflow(server_url)
+    if success:
+        logger.info(f"成功执行缓存工作流: {server_url} - {message}")
+    else:
+        logger.error(f"执行缓存工作流失败: {server_url} - {message}")
+    return "workflow_success" if success else "workflow_failed"
 
 # 定时任务，检查所有服务器（并行）
 async def scheduled_check():
@@ -290,11 +395,34 @@ async def scheduled_check():
     tasks = [check_and_execute(server) for server in settings.servers]
     await asyncio.gather(*tasks)
 
+# 预热探测，在预计驱逐窗口内额外检查服务器
+async def prewarm_check(server_url: str):
+    """在预计驱逐窗口内探测服务器，发现缓存未加载时立即执行工作流"""
+    try:
+        logger.info(f"处于预计缓存驱逐窗口，执行预热探测: {server_url}")
+        await check_and_execute(server_url, trigger="prewarm")
+    finally:
+        # 释放scheduled_prewarm中的占位
+        checks_in_flight[server_url] -= 1
+
+async def scheduled_prewarm():
+    """
+    对处于预计驱逐窗口内的服务器执行预热探测（不等待完成，避免阻塞下一次调度）。
+    服务器已有检查（常规或预热）在进行时跳过，避免重复探测和重复等待自动执行
+    """
+    for server in settings.servers:
+        if checks_in_flight.get(server, 0) == 0 and eviction_predictor.in_prewarm_window(server):
+            # 先占位，任务真正开始前的下一次调度也不会重复创建
+            checks_in_flight[server] = 1
+            asyncio.create_task(prewarm_check(server))
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动时执行的事件"""
     # 添加定时任务，按照配置的间隔检查服务器
     scheduler.add_job(scheduled_check, 'interval', seconds=settings.check_interval_seconds)
+    if settings.prewarm_enabled:
+        scheduler.add_job(scheduled_prewarm, 'interval', seconds=settings.prewarm_probe_interval_seconds)
     scheduler.start()
     logger.info("缓存检查定时任务已启动")
     
@@ -575,19 +703,55 @@ async def get_submission_status():
         
         # 计算距离上次提交的时间
         time_since_last_submission = current_time - last_submission_time if last_submission_time > 0 else None
-        can_submit = time_since_last_submission is None or time_since_last_submission >= 30
+        next_submission_allowed_in = submission_wait_seconds(submission_info, current_time, settings.submit_cooldown_seconds)
         
         results.append({
             "server": server,
             "is_submitting": is_submitting,
             "last_submission_time": last_submission_time,
             "time_since_last_submission": time_since_last_submission,
-            "can_submit": can_submit and not is_submitting,
-            "next_submission_allowed_in": max(0, 30 - time_since_last_submission) if time_since_last_submission is not None and time_since_last_submission < 30 else 0
+            "can_submit": next_submission_allowed_in == 0 and not is_submitting,
+            "next_submission_allowed_in": next_submission_allowed_in
         })
     
     return {"submission_status": results, "current_time": current_time}
 
+@app.get("/api/prewarm")
+async def prewarm_status():
+    """获取每个服务器学习到的驱逐预测、预测命中率和缓存未加载时长"""
+    return {
+        "enabled": settings.prewarm_enabled,
+        "servers": [eviction_predictor.summary(server) for server in settings.servers],
+        "current_time": time.time()
+    }
+
+@app.get("/api/trace/{server}")
+async def get_server_trace(server: str, trigger: str = "regular"):
+    """
+    获取特定服务器最近的检查周期trace（server可以是索引或host:port）。
+    trigger为regular时返回定时/手动检查，为prewarm时返回预热探测
+    """
+    server_url = None
+    if server.isdigit():
+        if int(server) < len(settings.servers):
+            server_url = settings.servers[int(server)]
+    else:
+        for candidate in settings.servers:
+            if candidate == server or candidate.split("://", 1)[-1] == server:
+                server_url = candidate
+                break
+    
+    if server_url is None:
+        return {"error": "服务器无效"}
+    
+    traces = trace_store.get(server_url, trigger)
+    return {
+        "server": server_url,
+        "trigger": trigger,
+        "buffer_size": trace_store.buffer_size,
+        "traces": [trace.to_dict() for trace in reversed(traces)]
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host=settings.host, port=settings.port, reload=True)
\ No newline at end of file
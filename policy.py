@@ -0,0 +1,43 @@
+from typing import Dict, Any, Optional
+
+# 检查周期中每次探测后的下一步动作
+CACHE_LOADED = "cache_loaded"       # 缓存已加载，本次检查结束
+WAIT_AUTO_EXEC = "wait_auto_exec"   # 服务器已自动执行，等待后重新探测
+SUBMIT = "submit"                   # 提交缓存工作流
+
+# 不能提交工作流的原因
+SUBMITTING = "submitting"
+COOLDOWN = "cooldown"
+
+
+# 以下规则由main.py和回放模拟器simulator.py共用，保证两边的判断流程一致
+
+def next_check_action(cache_loaded: bool, auto_executing: bool, waited_for_auto_exec: bool) -> str:
+    """
+    根据探测结果决定检查周期的下一步：
+    已加载则结束；服务器提示自动执行且尚未等待过则等待后重新探测；否则提交工作流
+    """
+    if cache_loaded:
+        return CACHE_LOADED
+    if auto_executing and not waited_for_auto_exec:
+        return WAIT_AUTO_EXEC
+    return SUBMIT
+
+
+def submission_wait_seconds(status: Dict[str, Any], now: float, cooldown_seconds: float) -> float:
+    """
+    根据服务器的提交状态计算还需等待多少秒才能再次提交，0表示可以立即提交
+    """
+    last_submission = status.get("last_submission_time")
+    if last_submission is None:
+        return 0
+    return max(0, cooldown_seconds - (now - last_submission))
+
+
+def submission_block_reason(status: Dict[str, Any], now: float, cooldown_seconds: float) -> Optional[str]:
+    """不能提交工作流的原因（正在提交中或处于冷却时间内），可以提交时返回None"""
+    if status.get("is_submitting", False):
+        return SUBMITTING
+    if submission_wait_seconds(status, now, cooldown_seconds) > 0:
+        return COOLDOWN
+    return None
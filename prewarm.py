@@ -0,0 +1,276 @@
+import re
+import os
+import json
+import time
+import logging
+from collections import deque
+from typing import List, Dict, Any
+
+# 缓存未加载时determine接口返回的缓存键列表，例如
+# "未查询到缓存pulid_eva_clip,pulid_face_analysis,pulid_model,ben2_base，已经自动..."
+MISSING_KEYS_PATTERN = re.compile(r"未查询到缓存([^，。\s]+)")
+
+# 无法解析出具体缓存键时使用的键
+WHOLE_CACHE_KEY = "*"
+
+logger = logging.getLogger("cache_checker")
+
+
+def parse_missing_cache_keys(response_text: str) -> List[str]:
+    """从determine接口的返回文本中解析未加载的缓存键"""
+    match = MISSING_KEYS_PATTERN.search(response_text)
+    if not match:
+        return []
+    return [key.strip() for key in match.group(1).split(",") if key.strip()]
+
+
+def _local_midnight(timestamp: float) -> float:
+    lt = time.localtime(timestamp)
+    return time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday, 0, 0, 0, 0, 0, -1))
+
+
+class EvictionPredictor:
+    """
+    从探测历史中学习每个服务器、每个缓存键的驱逐时间（按一天中的时段统计），
+    并给出下一次预计驱逐的时间窗口
+    """
+
+    def __init__(self, slot_minutes: int = 15, min_occurrences: int = 2,
+                 lead_seconds: int = 120, history_days: int = 14, history_path: str = ""):
+        self.slot_seconds = slot_minutes * 60
+        self.min_occurrences = min_occurrences
+        self.lead_seconds = lead_seconds
+        self.history_seconds = history_days * 86400
+        self.history_path = history_path
+        # {server_url: {cache_key: (is_loaded, observed_at)}}
+        self.key_states: Dict[str, Dict[str, tuple]] = {}
+        # {server_url: {cache_key: deque([eviction_time, ...])}}
+        self.evictions: Dict[str, Dict[str, deque]] = {}
+        # {server_url: {window_start: {"window_end": ..., "cache_keys": [...], "hit": bool}}}
+        self.open_windows: Dict[str, Dict[float, Dict[str, Any]]] = {}
+        # {server_url: {"evictions": n, "predicted_evictions": n, "windows": n, "hits": n,
+        #               "cold_seconds": s, "cold_periods": n, "cold_since": ts}}
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self._load_history()
+
+    def _load_history(self):
+        """从文件恢复驱逐记录，重启后无需重新积累"""
+        if not self.history_path or not os.path.exists(self.history_path):
+            return
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"加载驱逐记录失败: {e}")
+            return
+        cutoff = time.time() - self.history_seconds
+        for server_url, keys in data.items():
+            for key, eviction_times in keys.items():
+                history = deque(sorted(t for t in eviction_times if t >= cutoff))
+                if history:
+                    self.evictions.setdefault(server_url, {})[key] = history
+
+    def _save_history(self):
+        if not self.history_path:
+            return
+        data = {
+            server_url: {key: list(history) for key, history in keys.items()}
+            for server_url, keys in self.evictions.items()
+        }
+        try:
+            directory = os.path.dirname(self.history_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 先写临时文件再替换，避免中途退出留下损坏的文件
+            temp_path = self.history_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.history_path)
+        except Exception as e:
+            logger.error(f"保存驱逐记录失败: {e}")
+
+    def _server_stats(self, server_url: str) -> Dict[str, Any]:
+        if server_url not in self.stats:
+            self.stats[server_url] = {
+                "evictions": 0,
+                "predicted_evictions": 0,
+                "windows": 0,
+                "hits": 0,
+                "cold_seconds": 0.0,
+                "cold_periods": 0,
+                "cold_since": None
+            }
+        return self.stats[server_url]
+
+    def observe(self, server_url: str, cache_loaded: bool, missing_keys: List[str], now: float = None):
+        """记录一次成功的缓存探测结果"""
+        if now is None:
+            now = time.time()
+        stats = self._server_stats(server_url)
+        # 先只登记窗口，驱逐时间取两次探测的中点，可能落在刚刚结束的窗口内，
+        # 要在匹配完驱逐之后再清理已结束的窗口
+        self._register_windows(server_url, now)
+
+        states = self.key_states.setdefault(server_url, {})
+        if not cache_loaded and not missing_keys:
+            # 无法解析具体缓存键时，视为所有已知的键都被驱逐
+            missing_keys = [key for key in states if key != WHOLE_CACHE_KEY] or [WHOLE_CACHE_KEY]
+        # 首次出现的缓存键沿用整体缓存的上一次状态
+        whole_state = states.get(WHOLE_CACHE_KEY)
+
+        # {cache_key: 估计的驱逐时间}
+        evicted: Dict[str, float] = {}
+        for key in set(states) | set(missing_keys):
+            is_loaded = cache_loaded or key not in missing_keys
+            previous = states.get(key, whole_state)
+            counted = key != WHOLE_CACHE_KEY or missing_keys == [WHOLE_CACHE_KEY]
+            if counted and previous is not None and previous[0] and not is_loaded:
+                # 上次已加载，本次未加载：驱逐发生在两次探测之间，取中点
+                evicted[key] = (previous[1] + now) / 2
+            states[key] = (is_loaded, now)
+        states[WHOLE_CACHE_KEY] = (cache_loaded, now)
+
+        if evicted:
+            self._record_eviction(server_url, evicted, now)
+        self._prune_windows(server_url, now)
+
+        # 统计缓存未加载的时长：从估计的驱逐时间开始，到第一次探测到已加载为止
+        if cache_loaded:
+            if stats["cold_since"] is not None:
+                stats["cold_seconds"] += now - stats["cold_since"]
+                stats["cold_since"] = None
+        elif stats["cold_since"] is None:
+            if evicted:
+                stats["cold_since"] = min(evicted.values())
+            elif whole_state is not None and whole_state[0]:
+                stats["cold_since"] = (whole_state[1] + now) / 2
+            else:
+                stats["cold_since"] = now
+            stats["cold_periods"] += 1
+
+    def _record_eviction(self, server_url: str, evicted: Dict[str, float], now: float):
+        """记录一次驱逐事件（同一次探测发现的多个缓存键算作一次）"""
+        stats = self._server_stats(server_url)
+        stats["evictions"] += 1
+        eviction_time = min(evicted.values())
+
+        predicted = False
+        for window_start, window in self.open_windows.get(server_url, {}).items():
+            if window_start <= eviction_time <= window["window_end"] and set(window["cache_keys"]) & set(evicted):
+                if not window["hit"]:
+                    window["hit"] = True
+                    stats["hits"] += 1
+                predicted = True
+        if predicted:
+            stats["predicted_evictions"] += 1
+
+        for key, key_eviction_time in evicted.items():
+            history = self.evictions.setdefault(server_url, {}).setdefault(key, deque())
+            history.append(key_eviction_time)
+            while history and history[0] < now - self.history_seconds:
+                history.popleft()
+        self._save_history()
+
+    def _slot_days(self, server_url: str, key: str) -> Dict[int, List[tuple]]:
+        """每个时段发生过驱逐的日期：{slot: [(midnight, eviction_time), ...]}"""
+        days_per_slot: Dict[int, List[tuple]] = {}
+        for eviction_time in self.evictions.get(server_url, {}).get(key, []):
+            midnight = _local_midnight(eviction_time)
+            slot = int((eviction_time - midnight) // self.slot_seconds)
+            days_per_slot.setdefault(slot, []).append((midnight, eviction_time))
+        return days_per_slot
+
+    def predictions(self, server_url: str, now: float = None) -> List[Dict[str, Any]]:
+        """未来24小时内预计的驱逐窗口（包括当前正处于的窗口），同一时段的缓存键合并为一个窗口"""
+        if now is None:
+            now = time.time()
+        midnight = _local_midnight(now)
+        # {window_start: prediction}
+        windows: Dict[float, Dict[str, Any]] = {}
+        for key in self.evictions.get(server_url, {}):
+            for slot, days in self._slot_days(server_url, key).items():
+                for day_offset in (-1, 0, 1):
+                    slot_start = midnight + day_offset * 86400 + slot * self.slot_seconds
+                    window_start = slot_start - self.lead_seconds
+                    window_end = slot_start + self.slot_seconds
+                    # 只使用窗口开始之前的驱逐记录，避免窗口内的驱逐"预测"自己
+                    occurrences = len({day for day, eviction_time in days if eviction_time < window_start})
+                    if occurrences < self.min_occurrences:
+                        continue
+                    if window_end > now and window_start < now + 86400:
+                        if window_start not in windows:
+                            windows[window_start] = {
+                                "cache_keys": [],
+                                "slot": time.strftime("%H:%M", time.localtime(slot_start)),
+                                "occurrences": 0,
+                                "window_start": window_start,
+                                "window_end": window_end,
+                                "active": window_start <= now
+                            }
+                        windows[window_start]["cache_keys"].append(key)
+                        windows[window_start]["occurrences"] = max(windows[window_start]["occurrences"], occurrences)
+                        break
+        results = sorted(windows.values(), key=lambda item: item["window_start"])
+        for prediction in results:
+            prediction["cache_keys"].sort()
+        return results
+
+    def refresh(self, server_url: str, now: float = None):
+        """登记进入的预测窗口，并结算已经结束的窗口"""
+        if now is None:
+            now = time.time()
+        self._register_windows(server_url, now)
+        self._prune_windows(server_url, now)
+
+    def _register_windows(self, server_url: str, now: float):
+        stats = self._server_stats(server_url)
+        windows = self.open_windows.setdefault(server_url, {})
+
+        for prediction in self.predictions(server_url, now):
+            window_start = prediction["window_start"]
+            if prediction["active"] and window_start not in windows:
+                windows[window_start] = {
+                    "window_end": prediction["window_end"],
+                    "cache_keys": prediction["cache_keys"],
+                    "hit": False
+                }
+                stats["windows"] += 1
+
+    def _prune_windows(self, server_url: str, now: float):
+        windows = self.open_windows.setdefault(server_url, {})
+        for window_start in [w for w, window in windows.items() if window["window_end"] < now]:
+            del windows[window_start]
+
+    def in_prewarm_window(self, server_url: str, now: float = None) -> bool:
+        """当前是否处于预计驱逐窗口内（需要加密探测）"""
+        self.refresh(server_url, now)
+        return bool(self.open_windows.get(server_url))
+
+    def summary(self, server_url: str, now: float = None) -> Dict[str, Any]:
+        if now is None:
+            now = time.time()
+        self.refresh(server_url, now)
+        stats = self._server_stats(server_url)
+        cold_seconds = stats["cold_seconds"]
+        if stats["cold_since"] is not None:
+            cold_seconds += now - stats["cold_since"]
+        # 已结算的窗口中命中的比例（仍在进行中的窗口不计入）
+        open_count = len(self.open_windows.get(server_url, {}))
+        open_hits = sum(1 for window in self.open_windows.get(server_url, {}).values() if window["hit"])
+        resolved = stats["windows"] - open_count
+        resolved_hits = stats["hits"] - open_hits
+        return {
+            "server": server_url,
+            "predictions": self.predictions(server_url, now),
+            "evictions": stats["evictions"],
+            "predicted_evictions": stats["predicted_evictions"],
+            "eviction_coverage": stats["predicted_evictions"] / stats["evictions"] if stats["evictions"] else None,
+            "prediction_windows": resolved,
+            "prediction_hits": resolved_hits,
+            "hit_rate": resolved_hits / resolved if resolved else None,
+            # 保留期内每个缓存键的驱逐次数（按键统计，不计入上面的服务器级统计）
+            "key_evictions": {key: len(history) for key, history in self.evictions.get(server_url, {}).items()},
+            "cold_seconds": cold_seconds,
+            "cold_periods": stats["cold_periods"],
+            "is_cold": stats["cold_since"] is not None
+        }
@@ -0,0 +1,40 @@
+import json
+import os
+import time
+import logging
+from typing import List, Dict, Any
+
+logger = logging.getLogger("cache_checker")
+
+
+class EventRecorder:
+    """将探测、提交、完成等事件按时间顺序追加写入JSON Lines文件，供回放模拟器使用"""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+
+    def record(self, server_url: str, event: str, **fields):
+        if not self.path:
+            return
+        entry = {"time": time.time(), "server": server_url, "event": event}
+        entry.update(fields)
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.error(f"记录事件失败: {e}")
+
+
+def load_events(path: str) -> List[Dict[str, Any]]:
+    """读取记录的事件，按时间排序"""
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    events.sort(key=lambda event: event["time"])
+    return events
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+回放模拟器 - 在虚拟时间中用记录的事件评估调度策略
+
+用法:
+    python simulator.py events.jsonl --check-interval 60 --submit-cooldown 30 --auto-exec-wait 20
+
+事件文件由主程序在设置 record_path 后记录。模拟器从记录中还原每个服务器的
+缓存驱逐时间、工作流耗时以及是否会自动在后台执行工作流，然后在虚拟时间中
+运行与主程序相同的调度和判断逻辑（定时检查、预测性预热探测、自动执行等待、
+提交冷却、等待完成），比实际时间快得多地得出探测请求数、重复提交数、预热耗时和
+缓存未加载时长。
+
+检查周期每一步的判断（policy.next_check_action）和提交前的检查
+（policy.submission_block_reason）与main.py共用；预热探测使用同一个
+EvictionPredictor，在回放过程中从模拟的探测结果学习驱逐规律（不读取
+prewarm_history_path）。
+"""
+
+import asyncio
+import argparse
+import json
+import selectors
+import statistics
+import time
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Optional
+
+from recorder import load_events
+from policy import CACHE_LOADED, WAIT_AUTO_EXEC, next_check_action, submission_block_reason
+from prewarm import EvictionPredictor
+
+# 记录中没有完整的提交-完成记录时使用的工作流耗时（秒）
+DEFAULT_WARMUP_SECONDS = 60.0
+
+
+@dataclass
+class Policy:
+    """待评估的调度参数，对应config.py中的同名配置"""
+    check_interval_seconds: float = 30
+    submit_cooldown_seconds: float = 30
+    auto_exec_wait_seconds: float = 30
+    workflow_timeout_seconds: float = 120
+    # wait_for_workflow_completion中查询队列的间隔
+    poll_interval_seconds: float = 2
+    # 预测性预热
+    prewarm_enabled: bool = True
+    prewarm_probe_interval_seconds: float = 10
+    prewarm_lead_seconds: float = 120
+    prewarm_slot_minutes: int = 15
+    prewarm_min_occurrences: int = 2
+    prewarm_history_days: int = 14
+
+
+class _VirtualTimeSelector(selectors.DefaultSelector):
+    """没有就绪的IO时不阻塞，而是直接把虚拟时钟拨到下一个定时任务"""
+
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if not events and timeout:
+            self.loop.virtual_time += timeout
+        return events
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """asyncio.sleep等基于loop.time()的等待全部在虚拟时间中完成"""
+
+    def __init__(self):
+        selector = _VirtualTimeSelector()
+        super().__init__(selector)
+        selector.loop = self
+        self.virtual_time = 0.0
+
+    def time(self):
+        return self.virtual_time
+
+
+class SimulatedServer:
+    """按记录还原的ComfyUI服务器：在记录的时间点被驱逐缓存，提交的工作流按队列顺序执行"""
+
+    def __init__(self, server_url: str, loop: VirtualTimeLoop, cache_loaded: bool, auto_executes: bool,
+                 warmup_seconds: float, auto_warmup_seconds: float, evictions: List[float]):
+        self.server = server_url
+        self.loop = loop
+        self.cache_loaded = cache_loaded
+        self.auto_executes = auto_executes
+        self.warmup_seconds = warmup_seconds
+        self.auto_warmup_seconds = auto_warmup_seconds
+        self.evictions = evictions
+        # 队列中最后一个工作流完成的时间
+        self.busy_until = 0.0
+        self.auto_executing_until = 0.0
+        # {prompt_id: 完成时间}
+        self.jobs: Dict[str, float] = {}
+
+        self.cold_since = None if cache_loaded else 0.0
+        self.cold_periods: List[float] = []
+        self.probe_requests = 0
+        self.poll_requests = 0
+        self.submissions = 0
+        self.duplicate_submissions = 0
+        self.skipped_submissions = 0
+
+        for eviction_time in evictions:
+            loop.call_at(eviction_time, self._evict)
+
+    def _evict(self):
+        if self.cache_loaded:
+            self.cache_loaded = False
+            self.cold_since = self.loop.time()
+
+    def _enqueue(self, duration: float) -> float:
+        now = self.loop.time()
+        finish_time = max(now, self.busy_until) + duration
+        self.busy_until = finish_time
+        self.loop.call_at(finish_time, self._warm)
+        return finish_time
+
+    def _warm(self):
+        if not self.cache_loaded:
+            self.cache_loaded = True
+            self.cold_periods.append(self.loop.time() - self.cold_since)
+            self.cold_since = None
+
+    def probe(self):
+        """对应 /inspire/cache/determine，返回 (缓存是否已加载, 服务器是否已自动执行工作流)"""
+        self.probe_requests += 1
+        if self.cache_loaded:
+            return True, False
+        if not self.auto_executes:
+            return False, False
+        # 会自动执行的服务器发现缓存未加载时在后台排队一个缓存工作流
+        now = self.loop.time()
+        if self.auto_executing_until <= now:
+            self.auto_executing_until = self._enqueue(self.auto_warmup_seconds)
+        return False, True
+
+    def submit(self) -> str:
+        """对应 POST /prompt"""
+        now = self.loop.time()
+        self.submissions += 1
+        if self.cache_loaded or self.busy_until > now:
+            self.duplicate_submissions += 1
+        prompt_id = f"sim-{self.submissions}"
+        self.jobs[prompt_id] = self._enqueue(self.warmup_seconds)
+        return prompt_id
+
+    def is_finished(self, prompt_id: str) -> bool:
+        """对应 /api/queue 查询"""
+        self.poll_requests += 1
+        return self.jobs[prompt_id] <= self.loop.time()
+
+    def report(self, end_time: float) -> Dict[str, Any]:
+        # time_to_warm只统计已经恢复加载的未加载时段；模拟结束时仍未加载的时段单独列出，
+        # 但计入cold_cache_minutes
+        unfinished_cold_seconds = end_time - self.cold_since if self.cold_since is not None else 0.0
+        cold_seconds = sum(self.cold_periods) + unfinished_cold_seconds
+        return {
+            "server": self.server,
+            "probe_requests": self.probe_requests,
+            "poll_requests": self.poll_requests,
+            "submissions": self.submissions,
+            "duplicate_submissions": self.duplicate_submissions,
+            "skipped_submissions": self.skipped_submissions,
+            "evictions": len(self.evictions),
+            "cold_cache_minutes": cold_seconds / 60,
+            "unfinished_cold_periods": 1 if self.cold_since is not None else 0,
+            "unfinished_cold_minutes": unfinished_cold_seconds / 60,
+            "time_to_warm": _distribution(self.cold_periods)
+        }
+
+
+def _distribution(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "max": None}
+    return {
+        "count": len(values),
+        "mean": statistics.mean(values),
+        "p50": statistics.median(values),
+        "max": max(values)
+    }
+
+
+class SimulatedChecker:
+    """与main.py中check_and_execute / execute_workflow / scheduled_check / scheduled_prewarm相同的流程"""
+
+    def __init__(self, servers: List[SimulatedServer], policy: Policy, loop: VirtualTimeLoop, start_time: float):
+        self.servers = servers
+        self.policy = policy
+        self.loop = loop
+        # 记录开始的实际时间，预测器按一天中的时段学习，需要换算回实际时间
+        self.start_time = start_time
+        self.predictor = EvictionPredictor(
+            slot_minutes=policy.prewarm_slot_minutes,
+            min_occurrences=policy.prewarm_min_occurrences,
+            lead_seconds=policy.prewarm_lead_seconds,
+            history_days=policy.prewarm_history_days
+        )
+        self.submission_status: Dict[str, Dict[str, Any]] = {}
+        self.checks_in_flight: Dict[str, int] = {}
+        self.skipped_ticks = 0
+        self.prewarm_checks = 0
+
+    def _now(self) -> float:
+        return self.start_time + self.loop.time()
+
+    def check_cache_status(self, server: SimulatedServer):
+        cache_loaded, auto_executing = server.probe()
+        self.predictor.observe(server.server, cache_loaded, [], self._now())
+        return cache_loaded, auto_executing
+
+    async def wait_for_workflow_completion(self, server: SimulatedServer, prompt_id: str):
+        start_time = self.loop.time()
+        while self.loop.time() - start_time < self.policy.workflow_timeout_seconds:
+            if server.is_finished(prompt_id):
+                # 获取执行历史
+                server.poll_requests += 1
+                return True
+            await asyncio.sleep(self.policy.poll_interval_seconds)
+        return False
+
+    async def execute_workflow(self, server: SimulatedServer):
+        status = self.submission_status.get(server.server)
+        # 与main.py一样使用实际时间戳：虚拟时间从0开始，0会被当作"从未提交"
+        if status and submission_block_reason(status, self._now(), self.policy.submit_cooldown_seconds):
+            server.skipped_submissions += 1
+            return False
+
+        self.submission_status[server.server] = {
+            "is_submitting": True,
+            "last_submission_time": self._now()
+        }
+        try:
+            prompt_id = server.submit()
+            return await self.wait_for_workflow_completion(server, prompt_id)
+        finally:
+            self.submission_status[server.server]["is_submitting"] = False
+
+    async def check_and_execute(self, server: SimulatedServer):
+        self.checks_in_flight[server.server] = self.checks_in_flight.get(server.server, 0) + 1
+        try:
+            waited = False
+            while True:
+                cache_loaded, auto_executing = self.check_cache_status(server)
+                action = next_check_action(cache_loaded, auto_executing, waited)
+                if action == CACHE_LOADED:
+                    return
+                elif action == WAIT_AUTO_EXEC:
+                    await asyncio.sleep(self.policy.auto_exec_wait_seconds)
+                    waited = True
+                else:
+                    break
+            await self.execute_workflow(server)
+        finally:
+            self.checks_in_flight[server.server] -= 1
+
+    async def scheduled_check(self):
+        await asyncio.gather(*[self.check_and_execute(server) for server in self.servers])
+
+    async def prewarm_check(self, server: SimulatedServer):
+        self.prewarm_checks += 1
+        try:
+            await self.check_and_execute(server)
+        finally:
+            self.checks_in_flight[server.server] -= 1
+
+    def scheduled_prewarm(self, pending: List[asyncio.Future]):
+        for server in self.servers:
+            if (self.checks_in_flight.get(server.server, 0) == 0
+                    and self.predictor.in_prewarm_window(server.server, self._now())):
+                self.checks_in_flight[server.server] = 1
+                pending.append(asyncio.ensure_future(self.prewarm_check(server)))
+
+    async def run_prewarm(self, end_time: float, pending: List[asyncio.Future]):
+        """预热任务只创建探测任务、不等待完成，不会因上一次未结束而被跳过"""
+        interval = self.policy.prewarm_probe_interval_seconds
+        tick = 1
+        while tick * interval <= end_time:
+            await asyncio.sleep(tick * interval - self.loop.time())
+            tick += 1
+            self.scheduled_prewarm(pending)
+
+    async def run(self, end_time: float):
+        """启动时立即检查一次，之后按间隔检查；与APScheduler默认的max_instances=1一致，
+        上一次检查未结束时跳过本次"""
+        pending = [asyncio.ensure_future(self.scheduled_check())]
+        if self.policy.prewarm_enabled:
+            pending.append(asyncio.ensure_future(self.run_prewarm(end_time, pending)))
+        running = None
+        tick = 1
+        while tick * self.policy.check_interval_seconds <= end_time:
+            await asyncio.sleep(tick * self.policy.check_interval_seconds - self.loop.time())
+            tick += 1
+            if running is not None and not running.done():
+                self.skipped_ticks += 1
+                continue
+            running = asyncio.ensure_future(self.scheduled_check())
+            pending.append(running)
+        # 预热任务可能在等待期间继续追加探测任务，直到全部完成
+        while not all(task.done() for task in pending):
+            await asyncio.gather(*pending)
+
+
+def _median(values: List[float], default: float) -> float:
+    return statistics.median(values) if values else default
+
+
+def build_servers(events: List[Dict[str, Any]], loop: VirtualTimeLoop, start_time: float,
+                  warmup_seconds: float = None) -> List[SimulatedServer]:
+    """从记录的事件还原每个服务器的驱逐时间和工作流耗时（时间换算为相对记录开始的秒数）"""
+    by_server: Dict[str, List[Dict[str, Any]]] = {}
+    for event in events:
+        by_server.setdefault(event["server"], []).append(event)
+
+    servers = []
+    for server_url, server_events in by_server.items():
+        probes = [e for e in server_events if e["event"] == "probe" and e.get("ok", True)]
+        if not probes:
+            continue
+
+        # 两次探测之间由已加载变为未加载，视为驱逐发生在中点
+        evictions = []
+        for previous, current in zip(probes, probes[1:]):
+            if previous["cache_loaded"] and not current["cache_loaded"]:
+                evictions.append((previous["time"] + current["time"]) / 2 - start_time)
+
+        # 提交到完成的耗时
+        submit_times = {e["prompt_id"]: e["time"] for e in server_events
+                        if e["event"] == "submit" and e.get("ok", True) and e.get("prompt_id")}
+        durations = [e["time"] - submit_times[e["prompt_id"]] for e in server_events
+                     if e["event"] == "completion" and e.get("success") and e.get("prompt_id") in submit_times]
+
+        # 服务器自动执行：从第一次提示自动执行到下一次探测到已加载
+        auto_durations = []
+        auto_start = None
+        for probe in probes:
+            if probe["cache_loaded"]:
+                if auto_start is not None:
+                    auto_durations.append(probe["time"] - auto_start)
+                auto_start = None
+            elif probe.get("auto_executing") and auto_start is None:
+                auto_start = probe["time"]
+
+        workflow_seconds = warmup_seconds or _median(durations, DEFAULT_WARMUP_SECONDS)
+        servers.append(SimulatedServer(
+            server_url,
+            loop,
+            cache_loaded=probes[0]["cache_loaded"],
+            auto_executes=any(probe.get("auto_executing") for probe in probes),
+            warmup_seconds=workflow_seconds,
+            auto_warmup_seconds=_median(auto_durations, workflow_seconds),
+            evictions=evictions
+        ))
+    return servers
+
+
+def simulate(events: List[Dict[str, Any]], policy: Policy, warmup_seconds: float = None) -> Dict[str, Any]:
+    """在虚拟时间中回放记录，返回策略评估报告"""
+    if not events:
+        raise ValueError("记录中没有事件")
+    start_time = events[0]["time"]
+    end_time = events[-1]["time"] - start_time
+
+    wall_start = time.time()
+    loop = VirtualTimeLoop()
+    try:
+        servers = build_servers(events, loop, start_time, warmup_seconds)
+        checker = SimulatedChecker(servers, policy, loop, start_time)
+        loop.run_until_complete(checker.run(end_time))
+    finally:
+        loop.close()
+
+    server_reports = [server.report(end_time) for server in servers]
+    totals = {
+        key: sum(report[key] for report in server_reports)
+        for key in ("probe_requests", "poll_requests", "submissions", "duplicate_submissions",
+                    "skipped_submissions", "evictions", "cold_cache_minutes",
+                    "unfinished_cold_periods", "unfinished_cold_minutes")
+    }
+    totals["time_to_warm"] = _distribution([
+        value for server in servers for value in server.cold_periods
+    ])
+    return {
+        "policy": asdict(policy),
+        "simulated_seconds": end_time,
+        "wall_seconds": time.time() - wall_start,
+        "skipped_ticks": checker.skipped_ticks,
+        "prewarm_checks": checker.prewarm_checks,
+        "prewarm": [checker.predictor.summary(server.server, start_time + end_time) for server in servers],
+        "totals": totals,
+        "servers": server_reports,
+        # 记录期间检查器实际发生的请求数，便于与模拟结果对照。
+        # 状态页面/接口的探测（source=status）不属于检查器，不计入；驱逐时间的推算仍使用全部探测
+        "recorded": {
+            "probe_requests": sum(1 for e in events
+                                  if e["event"] == "probe" and e.get("source", "regular") != "status"),
+            "status_probe_requests": sum(1 for e in events
+                                         if e["event"] == "probe" and e.get("source") == "status"),
+            "submissions": sum(1 for e in events if e["event"] == "submit"),
+            "skipped_submissions": sum(1 for e in events if e["event"] == "submit_skipped")
+        }
+    }
+
+
+if __name__ == "__main__":
+    from config import settings
+
+    parser = argparse.ArgumentParser(description="在虚拟时间中回放记录的事件，评估调度策略")
+    parser.add_argument("events", help="record_path记录的事件文件")
+    parser.add_argument("--check-interval", type=float, default=settings.check_interval_seconds)
+    parser.add_argument("--submit-cooldown", type=float, default=settings.submit_cooldown_seconds)
+    parser.add_argument("--auto-exec-wait", type=float, default=settings.auto_exec_wait_seconds)
+    parser.add_argument("--workflow-timeout", type=float, default=settings.workflow_timeout_seconds)
+    parser.add_argument("--no-prewarm", action="store_true", default=not settings.prewarm_enabled,
+                        help="不模拟预测性预热探测")
+    parser.add_argument("--prewarm-probe-interval", type=float, default=settings.prewarm_probe_interval_seconds)
+    parser.add_argument("--prewarm-lead", type=float, default=settings.prewarm_lead_seconds)
+    parser.add_argument("--prewarm-slot-minutes", type=int, default=settings.prewarm_slot_minutes)
+    parser.add_argument("--prewarm-min-occurrences", type=int, default=settings.prewarm_min_occurrences)
+    parser.add_argument("--warmup-seconds", type=float, default=None,
+                        help="工作流耗时，默认使用记录中提交到完成的中位数")
+    args = parser.parse_args()
+
+    policy = Policy(
+        check_interval_seconds=args.check_interval,
+        submit_cooldown_seconds=args.submit_cooldown,
+        auto_exec_wait_seconds=args.auto_exec_wait,
+        workflow_timeout_seconds=args.workflow_timeout,
+        prewarm_enabled=not args.no_prewarm,
+        prewarm_probe_interval_seconds=args.prewarm_probe_interval,
+        prewarm_lead_seconds=args.prewarm_lead,
+        prewarm_slot_minutes=args.prewarm_slot_minutes,
+        prewarm_min_occurrences=args.prewarm_min_occurrences,
+        prewarm_history_days=settings.prewarm_history_days
+    )
+    report = simulate(load_events(args.events), policy, args.warmup_seconds)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,94 @@
+"""
+EvictionPredictor 的单元测试（不需要连接服务器）
+
+运行: python -m pytest -q test_prewarm.py
+"""
+
+import time
+
+from prewarm import EvictionPredictor, parse_missing_cache_keys
+
+SERVER = "http://127.0.0.1:8188"
+KEYS = ["pulid_eva_clip", "pulid_face_analysis", "pulid_model", "ben2_base"]
+
+# 2026-10-01 03:00（本地时间），默认15分钟时段，预测窗口为 02:58 ~ 03:15
+DAY0_3AM = time.mktime((2026, 10, 1, 3, 0, 0, 0, 0, -1))
+DAY = 86400
+
+
+def nightly_evictions(predictor, days, keys=KEYS):
+    """每天03:00前后各探测一次，中间发生驱逐（估计驱逐时间为03:00整）"""
+    for day in range(days):
+        t = DAY0_3AM + day * DAY
+        predictor.observe(SERVER, True, [], t - 60)
+        predictor.observe(SERVER, False, keys, t + 60)
+        predictor.observe(SERVER, True, [], t + 300)
+
+
+def test_parse_missing_cache_keys():
+    text = "未查询到缓存pulid_eva_clip,pulid_face_analysis,pulid_model,ben2_base，已经自动在后台执行缓存模型工作流。"
+    assert parse_missing_cache_keys(text) == KEYS
+    assert parse_missing_cache_keys("缓存已加载。") == []
+
+
+def test_recurring_slot_becomes_prediction():
+    predictor = EvictionPredictor(min_occurrences=2)
+
+    nightly_evictions(predictor, 1)
+    assert predictor.predictions(SERVER, DAY0_3AM + DAY - 3600) == []
+
+    nightly_evictions(predictor, 2)
+    predictions = predictor.predictions(SERVER, DAY0_3AM + 2 * DAY - 3600)
+    assert len(predictions) == 1
+    assert predictions[0]["slot"] == "03:00"
+    assert predictions[0]["window_start"] == DAY0_3AM + 2 * DAY - 120
+    assert predictions[0]["window_end"] == DAY0_3AM + 2 * DAY + 900
+    assert not predictions[0]["active"]
+    assert not predictor.in_prewarm_window(SERVER, DAY0_3AM + 2 * DAY - 3600)
+    assert predictor.in_prewarm_window(SERVER, DAY0_3AM + 2 * DAY - 60)
+
+
+def test_multi_key_eviction_counts_once():
+    predictor = EvictionPredictor()
+    nightly_evictions(predictor, 3)
+
+    summary = predictor.summary(SERVER, DAY0_3AM + 3 * DAY - 3600)
+    assert summary["evictions"] == 3
+    assert summary["key_evictions"] == {key: 3 for key in KEYS}
+    # 第3天的窗口由前两天的记录预测，命中一次
+    assert summary["prediction_windows"] == 1
+    assert summary["prediction_hits"] == 1
+    assert len(summary["predictions"]) == 1
+    assert summary["predictions"][0]["cache_keys"] == sorted(KEYS)
+
+
+def test_hit_at_window_end():
+    predictor = EvictionPredictor()
+    nightly_evictions(predictor, 2)
+
+    # 窗口结束(+900)前最后一次探测仍已加载，结束后才探测到未加载，中点+895仍在窗口内
+    t = DAY0_3AM + 2 * DAY
+    predictor.observe(SERVER, True, [], t + 870)
+    predictor.observe(SERVER, False, KEYS, t + 920)
+    predictor.observe(SERVER, True, [], t + 1000)
+
+    summary = predictor.summary(SERVER, t + 3600)
+    assert summary["prediction_windows"] == 1
+    assert summary["prediction_hits"] == 1
+    assert summary["hit_rate"] == 1.0
+    assert summary["eviction_coverage"] == 1 / 3
+
+
+def test_cold_seconds_start_at_estimated_eviction():
+    predictor = EvictionPredictor()
+    t = DAY0_3AM
+    predictor.observe(SERVER, True, [], t)
+    predictor.observe(SERVER, False, KEYS, t + 60)
+    # 仍未加载时，从估计的驱逐时间（两次探测的中点）算起
+    assert predictor.summary(SERVER, t + 100)["cold_seconds"] == 70
+    predictor.observe(SERVER, True, [], t + 300)
+
+    summary = predictor.summary(SERVER, t + 600)
+    assert summary["cold_seconds"] == 270
+    assert summary["cold_periods"] == 1
+    assert not summary["is_cold"]
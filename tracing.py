@@ -0,0 +1,197 @@
+import json
+import os
+import time
+import uuid
+import logging
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger("cache_checker")
+
+# 当前检查周期的trace（每个check_and_execute任务各自持有）
+current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+class Span:
+    """检查周期中的一个计时阶段"""
+
+    def __init__(self, name: str, parent_span_id: str, attributes: Dict[str, Any] = None):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.start_time = time.time()
+        self.end_time = None
+        self.attributes = dict(attributes or {})
+        self.ok = True
+
+    def end(self, ok: bool = True, **attributes):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time()
+        self.ok = ok
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration": self.duration,
+            "ok": self.ok,
+            "attributes": self.attributes
+        }
+
+
+class Trace:
+    """一次check_and_execute检查周期"""
+
+    def __init__(self, server_url: str, name: str = "check_and_execute", trigger: str = "regular"):
+        self.trace_id = uuid.uuid4().hex
+        self.server = server_url
+        # 触发来源：regular（定时/手动检查）或prewarm（预热探测），分别缓存
+        self.trigger = trigger
+        self.root = Span(name, None, {"server": server_url, "trigger": trigger})
+        self.spans: List[Span] = []
+
+    def start_span(self, name: str, **attributes) -> Span:
+        span = Span(name, self.root.span_id, attributes)
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(ok=False, error=str(e))
+            raise
+        finally:
+            span.end()
+
+    def finish(self, outcome: str):
+        # 关闭遗留的未结束阶段（例如异常提前返回时）
+        for span in self.spans:
+            span.end()
+        self.root.end(outcome=outcome)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "server": self.server,
+            "trigger": self.trigger,
+            "start_time": self.root.start_time,
+            "end_time": self.root.end_time,
+            "duration": self.root.duration,
+            "outcome": self.root.attributes.get("outcome"),
+            "spans": [span.to_dict() for span in self.spans]
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """转换为OTLP/JSON格式（ExportTraceServiceRequest）"""
+        return {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [_otlp_attribute("service.name", "cache_checker")]
+                },
+                "scopeSpans": [{
+                    "scope": {"name": "cache_checker"},
+                    "spans": [_otlp_span(self.trace_id, span) for span in [self.root] + self.spans]
+                }]
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_span(trace_id: str, span: Span) -> Dict[str, Any]:
+    end_time = span.end_time if span.end_time is not None else time.time()
+    result = {
+        "traceId": trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,
+        "startTimeUnixNano": str(int(span.start_time * 1e9)),
+        "endTimeUnixNano": str(int(end_time * 1e9)),
+        "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+        # 1 = STATUS_CODE_OK, 2 = STATUS_CODE_ERROR
+        "status": {"code": 1 if span.ok else 2}
+    }
+    if span.parent_span_id:
+        result["parentSpanId"] = span.parent_span_id
+    return result
+
+
+class TraceStore:
+    """按服务器和触发来源保存最近的trace（环形缓冲），并可选导出为OTLP JSON"""
+
+    def __init__(self, buffer_size: int = 50, export_path: str = ""):
+        self.buffer_size = buffer_size
+        self.export_path = export_path
+        # {(server_url, trigger): deque([trace, ...])}
+        self.buffers: Dict[tuple, deque] = {}
+
+    def add(self, trace: Trace):
+        # 预热探测很频繁，单独缓存，避免把常规检查的trace挤出缓冲区
+        buffer_key = (trace.server, trace.trigger)
+        if buffer_key not in self.buffers:
+            self.buffers[buffer_key] = deque(maxlen=self.buffer_size)
+        self.buffers[buffer_key].append(trace)
+        if self.export_path:
+            self.export(trace)
+
+    def get(self, server_url: str, trigger: str = "regular") -> List[Trace]:
+        return list(self.buffers.get((server_url, trigger), []))
+
+    def export(self, trace: Trace):
+        """以JSON Lines追加写入，每行一个OTLP请求体"""
+        try:
+            directory = os.path.dirname(self.export_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace.to_otlp(), ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.error(f"导出trace失败: {e}")
+
+
+@contextmanager
+def trace_span(name: str, **attributes):
+    """在当前trace中记录一个阶段；没有活动trace时不做任何事"""
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, **attributes) as span:
+        yield span
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """开始一个需要手动结束的阶段（用于跨越多次轮询的阶段）"""
+    trace = current_trace.get()
+    if trace is None:
+        return None
+    return trace.start_span(name, **attributes)
+
+
+def end_span(span: Optional[Span], **attributes):
+    if span is not None:
+        span.end(**attributes)